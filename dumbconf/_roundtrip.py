@@ -2,7 +2,6 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import collections
-import functools
 import re
 
 from dumbconf import _primitive
@@ -17,20 +16,32 @@ from dumbconf._tokenize import BARE_WORD_RE
 if str is bytes:  # pragma: no cover (PY2)
     text_type = unicode  # noqa
     int_types = (int, long)  # noqa
+    range = xrange  # noqa
 else:  # pragma: no cover (PY3)
     text_type = str
     int_types = (int,)
 
 
-class Settings(collections.namedtuple(
-        'Settings', ('indent', 'bare_keys', 'inline_small_containers'),
-)):
-    __slots__ = ()
+class Settings(object):
+    __slots__ = ('indent', 'bare_keys', 'inline_small_containers', '_indented')
+
+    def __init__(self, indent, bare_keys, inline_small_containers):
+        self.indent = indent
+        self.bare_keys = bare_keys
+        self.inline_small_containers = inline_small_containers
+        self._indented = None
 
     @property
     def indented(self):
-        assert self.indent >= 0
-        return self._replace(indent=self.indent + 1)
+        # each nesting level is computed once per dump and then reused
+        if self._indented is None:
+            assert self.indent >= 0
+            self._indented = Settings(
+                indent=self.indent + 1,
+                bare_keys=self.bare_keys,
+                inline_small_containers=self.inline_small_containers,
+            )
+        return self._indented
 
 
 Settings.DEFAULT = Settings(-1, True, True)
@@ -38,163 +49,336 @@ Settings.DEFAULT = Settings(-1, True, True)
 
 BARE_WORD_FULL_MATCH_RE = re.compile(BARE_WORD_RE.pattern + '$')
 
+# configuration tends to repeat the same keys, remember which are bare words
+_BARE_KEY_CACHE = {}
+_BARE_KEY_CACHE_SIZE = 4096
 
-def _python_value(ast_obj):
-    if isinstance(ast_obj, ast.PRIMITIVE):
-        return ast_obj.val
-    elif isinstance(ast_obj, ast.List):
-        return [_python_value(item.val) for item in ast_obj.items]
+
+def _is_bare_key(s):
+    try:
+        return _BARE_KEY_CACHE[s]
+    except KeyError:
+        ret = BARE_WORD_FULL_MATCH_RE.match(s) is not None
+        if len(_BARE_KEY_CACHE) < _BARE_KEY_CACHE_SIZE:
+            _BARE_KEY_CACHE[s] = ret
+        return ret
+
+
+# tokens are immutable so these can be shared across all dumps
+_COLON = ast.Colon(':')
+_COMMA = ast.Comma(',')
+_NL = ast.NL('\n')
+_SPACE = ast.Space(' ')
+
+_INDENT_TOKENS = tuple(ast.Indent('    ' * n) for n in range(64))
+
+
+def _indent_tok(n):
+    if n < len(_INDENT_TOKENS):
+        return _INDENT_TOKENS[n]
+    else:
+        return ast.Indent('    ' * n)
+
+
+def _python_container(ast_obj):
+    if isinstance(ast_obj, ast.List):
+        nodes = [item.val for item in ast_obj.items]
     elif isinstance(ast_obj, ast.Map):
-        return collections.OrderedDict(
-            (_python_value(item.key), _python_value(item.val))
-            for item in ast_obj.items
-        )
+        nodes = [
+            node for item in ast_obj.items for node in (item.key, item.val)
+        ]
     else:
         raise AssertionError('Unknown ast: {!r}'.format(ast_obj))
+    return ast_obj, iter(nodes), []
 
 
-def _to_tokens(val, settings=Settings.DEFAULT, key=False, top_level_map=False):
-    top_level_map = top_level_map and settings.indent == 0
-    if isinstance(val, text_type):
-        if settings.bare_keys and key and BARE_WORD_FULL_MATCH_RE.match(val):
-            return [ast.BareWordKey(val=val, src=val)]
+def _python_value(ast_obj):
+    if isinstance(ast_obj, ast.PRIMITIVE):
+        return ast_obj.val
+
+    # Containers are resolved with an explicit stack of
+    # (container, remaining child nodes, child values) rather than recursion
+    stack = [_python_container(ast_obj)]
+    while True:
+        container, nodes, values = stack[-1]
+        for node in nodes:
+            if isinstance(node, ast.PRIMITIVE):
+                values.append(node.val)
+            else:
+                stack.append(_python_container(node))
+                break
         else:
-            return [ast.String(val=val, src=_primitive.String.dump(val))]
-    elif isinstance(val, bool):
-        return [ast.Bool(val=val, src=_primitive.Bool.dump(val))]
-    elif val is None:
-        return [ast.Null(val=None, src=_primitive.Null.dump(val))]
-    elif isinstance(val, int_types):
-        return [ast.Int(val=val, src=_primitive.Int.dump(val))]
-    elif isinstance(val, float):
-        return [ast.Float(val=val, src=_primitive.Float.dump(val))]
-    elif isinstance(val, dict) and val and top_level_map:
-        return _top_level_map_tokens(val, settings)
-    elif isinstance(val, dict):
-        return _map_tokens(val, settings)
-    elif isinstance(val, (tuple, list)):
-        return _list_tokens(val, settings)
+            stack.pop()
+            if isinstance(container, ast.List):
+                val = values
+            else:
+                val = collections.OrderedDict(zip(values[::2], values[1::2]))
+            if stack:
+                stack[-1][2].append(val)
+            else:
+                return val
+
+
+# bound once, these are looked up for every primitive dumped
+_dump_bool = _primitive.Bool.dump
+_dump_float = _primitive.Float.dump
+_dump_int = _primitive.Int.dump
+_dump_null = _primitive.Null.dump
+_dump_str = _primitive.String.dump
+
+
+def _text_tokens(out, val, settings, key=False, top_level_map=False):
+    if settings.bare_keys and key and _is_bare_key(val):
+        out.append(ast.BareWordKey(val=val, src=val))
     else:
-        raise AssertionError('Unexpected value {!r}'.format(val))
-
-
-def _inline(val, settings, container_settings):
-    ret = [container_settings.start]
-    if val:
-        items = container_settings.to_iter(val)
-        ret.extend(container_settings.item_func(items[0], settings))
-        for item in items[1:]:
-            ret.extend((ast.Comma(','), ast.Space(' ')))
-            ret.extend(container_settings.item_func(item, settings))
-    ret.append(container_settings.end)
-    return ret
-
-
-def _multiline(val, settings, container_settings):
-    ret = [container_settings.start, ast.NL('\n')]
-    for item in container_settings.to_iter(val):
-        ret.append(ast.Indent('    ' * (settings.indented.indent)))
-        ret.extend(container_settings.item_func(item, settings.indented))
-        ret.extend((ast.Comma(','), ast.NL('\n')))
+        out.append(ast.String(val=val, src=_dump_str(val)))
+
+
+def _bool_tokens(out, val, settings, key=False, top_level_map=False):
+    out.append(ast.Bool(val=val, src=_dump_bool(val)))
+
+
+def _null_tokens(out, val, settings, key=False, top_level_map=False):
+    out.append(ast.Null(val=None, src=_dump_null(val)))
+
+
+def _int_tokens(out, val, settings, key=False, top_level_map=False):
+    out.append(ast.Int(val=val, src=_dump_int(val)))
+
+
+def _float_tokens(out, val, settings, key=False, top_level_map=False):
+    out.append(ast.Float(val=val, src=_dump_float(val)))
+
+
+def _dict_tokens(out, val, settings, key, top_level_map):
+    if val and top_level_map and settings.indent == 0:
+        _top_level_map_tokens(out, val, settings)
+    else:
+        _map_tokens(out, val, settings)
+
+
+def _sequence_tokens(out, val, settings, key, top_level_map):
+    _list_tokens(out, val, settings)
+
+
+# checked in order for types which are not in the dispatch table (subclasses)
+_TOKENS_HANDLERS = (
+    ((text_type,), _text_tokens),
+    ((bool,), _bool_tokens),
+    ((type(None),), _null_tokens),
+    (int_types, _int_tokens),
+    ((float,), _float_tokens),
+    ((dict,), _dict_tokens),
+    ((tuple, list), _sequence_tokens),
+)
+_TOKENS_DISPATCH = {
+    tp: handler for tps, handler in _TOKENS_HANDLERS for tp in tps
+}
+
+
+def _to_tokens(
+        out, val, settings=Settings.DEFAULT, key=False, top_level_map=False,
+):
+    try:
+        handler = _TOKENS_DISPATCH[type(val)]
+    except KeyError:
+        for tps, handler in _TOKENS_HANDLERS:
+            if isinstance(val, tps):
+                break
+        else:
+            raise AssertionError('Unexpected value {!r}'.format(val))
+    handler(out, val, settings, key, top_level_map)
+
+
+def _inline(out, items, settings, container_settings):
+    out.append(container_settings.start)
+    for i, item in enumerate(items):
+        if i:
+            out.extend((_COMMA, _SPACE))
+        container_settings.item_func(out, item, settings)
+    out.append(container_settings.end)
+
+
+def _multiline(out, items, settings, container_settings):
+    out.extend((container_settings.start, _NL))
+    for item in items:
+        out.append(_indent_tok(settings.indented.indent))
+        container_settings.item_func(out, item, settings.indented)
+        out.extend((_COMMA, _NL))
     if settings.indent > 0:
-        ret.append(ast.Indent('    ' * settings.indent))
-    ret.append(container_settings.end)
-    return ret
+        out.append(_indent_tok(settings.indent))
+    out.append(container_settings.end)
 
 
-def _container(val, settings, container_settings):
+def _container(out, val, settings, container_settings):
+    # `to_iter` is only called once, the result is sized and iterated
+    items = container_settings.to_iter(val)
     if (
             settings.indent < 0 or
-            not val or (
-                settings.inline_small_containers and
-                len(container_settings.to_iter(val)) < 2
-            )
+            not items or
+            (settings.inline_small_containers and len(items) < 2)
     ):
-        return _inline(val, settings, container_settings)
+        _inline(out, items, settings, container_settings)
     else:
-        return _multiline(val, settings, container_settings)
+        _multiline(out, items, settings, container_settings)
 
 
-def _map_item_tokens(kv, settings):
+def _map_item_tokens(out, kv, settings):
     k, v = kv
-    ret = []
-    ret.extend(_to_tokens(k, settings, key=True))
-    ret.extend((ast.Colon(':'), ast.Space(' ')))
-    ret.extend(_to_tokens(v, settings))
-    return ret
+    _to_tokens(out, k, settings, key=True)
+    out.extend((_COLON, _SPACE))
+    _to_tokens(out, v, settings)
 
 
-ContainerSettings = collections.namedtuple(
-    'ContainerSettings', ('start', 'end', 'item_func', 'to_iter'),
-)
+class ContainerSettings(object):
+    __slots__ = ('start', 'end', 'item_func', 'to_iter')
+
+    def __init__(self, start, end, item_func, to_iter):
+        self.start = start
+        self.end = end
+        self.item_func = item_func
+        self.to_iter = to_iter
 
 
-_map_tokens = functools.partial(
-    _container,
-    container_settings=ContainerSettings(
-        start=ast.MapStart('{'), end=ast.MapEnd('}'),
-        item_func=_map_item_tokens, to_iter=lambda m: tuple(m.items()),
-    ),
+_MAP_SETTINGS = ContainerSettings(
+    start=ast.MapStart('{'), end=ast.MapEnd('}'),
+    item_func=_map_item_tokens, to_iter=lambda m: m.items(),
 )
-_list_tokens = functools.partial(
-    _container,
-    container_settings=ContainerSettings(
-        start=ast.ListStart('['), end=ast.ListEnd(']'),
-        item_func=_to_tokens, to_iter=tuple,
-    ),
+
+
+def _map_tokens(out, val, settings):
+    _container(out, val, settings, _MAP_SETTINGS)
+
+
+_LIST_SETTINGS = ContainerSettings(
+    start=ast.ListStart('['), end=ast.ListEnd(']'),
+    item_func=_to_tokens, to_iter=lambda seq: seq,
 )
+# lists of a single primitive type go straight to that type's handler rather
+# than dispatching in `_to_tokens` for every item
+_PRIMITIVE_LIST_SETTINGS = {
+    tp: ContainerSettings(
+        start=_LIST_SETTINGS.start, end=_LIST_SETTINGS.end,
+        item_func=handler, to_iter=_LIST_SETTINGS.to_iter,
+    )
+    for tp, handler in _TOKENS_DISPATCH.items()
+    if handler not in {_dict_tokens, _sequence_tokens}
+}
 
 
-def _top_level_map_tokens(dct, settings):
-    tokens = []
+def _list_tokens(out, val, settings):
+    container_settings = _LIST_SETTINGS
+    types = {type(item) for item in val}
+    if len(types) == 1:
+        container_settings = _PRIMITIVE_LIST_SETTINGS.get(
+            types.pop(), container_settings,
+        )
+    _container(out, val, settings, container_settings)
+
+
+def _top_level_map_tokens(out, dct, settings):
     for kv in dct.items():
-        tokens.extend(_map_item_tokens(kv, settings))
-        tokens.append(ast.NL('\n'))
-    return tokens
+        _map_item_tokens(out, kv, settings)
+        out.append(_NL)
+
+
+def _tokens(*args, **kwargs):
+    tokens = []
+    _to_tokens(tokens, *args, **kwargs)
+    tokens.append(ast.EOF(''))
+    return tuple(tokens)
 
 
 def _to_ast(*args, **kwargs):
     # Run the parser to ensure a correct ast instead of building manually
-    tokens = tuple(_to_tokens(*args, **kwargs)) + (ast.EOF(''),)
-    return parse_from_tokens(tokens).val
+    return parse_from_tokens(_tokens(*args, **kwargs)).val
 
 
-def _key_index(val, key):
-    if isinstance(val, ast.Map):
+# Map lookups go through a {key: index} dict per Map node.  These live in an
+# `indexes` dict owned by the document's `AstProxy`, keyed by the node's `id`.
+# Nodes are never mutated, edits replace the nodes along the edited path and
+# move the indexes over so the cache only holds nodes of the current document.
+
+
+def _map_index(indexes, val):
+    try:
+        return indexes[id(val)][1]
+    except KeyError:
+        index = {}
         for i, item in enumerate(val.items):
-            if item.key.val == key:
-                return i
-        else:
+            index.setdefault(item.key.val, i)
+        indexes[id(val)] = (val, index)
+        return index
+
+
+def _move_index(indexes, old, new, keep):
+    entry = indexes.pop(id(old), None)
+    if keep and entry is not None:
+        indexes[id(new)] = (new, entry[1])
+
+
+def _forget_indexes(indexes, val):
+    # drop the indexes of a subtree which is leaving the document
+    todo = [val]
+    while todo:
+        val = todo.pop()
+        if isinstance(val, ast.Map):
+            indexes.pop(id(val), None)
+            todo.extend(item.val for item in val.items)
+        elif isinstance(val, ast.List):
+            todo.extend(item.val for item in val.items)
+
+
+def _key_index(indexes, val, key):
+    if isinstance(val, ast.Map):
+        try:
+            i = _map_index(indexes, val).get(key)
+        except TypeError:  # unhashable, so certainly not a key of the map
+            i = None
+        if i is None:
             raise AssertionError('TODO: KeyError(key)')
+        return i
     elif isinstance(val, ast.List):
-        return key
+        # normalize negative indices so they can be used for slicing
+        return range(len(val.items))[key]
     else:
         raise AssertionError('{!r}: not indexable'.format(val))
 
 
-def _get(obj, chain):
-    if not chain:
-        return obj
-    else:
-        key, rest = chain[0], chain[1:]
-        i = _key_index(obj.val, key)
-        target = obj.val.items[i]
-        if not rest:
-            return target
-        else:
-            return _get(target, rest)
+def _get(indexes, obj, chain):
+    for key in chain:
+        obj = obj.val.items[_key_index(indexes, obj.val, key)]
+    return obj
 
 
-def _modify_items(obj, chain, items_cb, *args):
-    key, rest = chain[0], chain[1:]
-    i = _key_index(obj.val, key)
+def _replace_items(obj, items):
+    return obj._replace(val=obj.val._replace(items=items))
 
-    if not rest:
-        new_items = items_cb(obj, i, *args)
-    else:
-        new_items = list(obj.val.items)
-        new_items[i] = _modify_items(new_items[i], rest, items_cb, *args)
-    return obj._replace(val=obj.val._replace(items=tuple(new_items)))
+
+def _replace_at(items, i, item):
+    return items[:i] + (item,) + items[i + 1:]
+
+
+def _modify_items(indexes, obj, chain, keep_index, items_cb, *args):
+    # walk down to the container being modified, remembering the path
+    parents = []
+    for key in chain[:-1]:
+        i = _key_index(indexes, obj.val, key)
+        parents.append((obj, i))
+        obj = obj.val.items[i]
+
+    i = _key_index(indexes, obj.val, chain[-1])
+    new_obj = _replace_items(obj, items_cb(obj, i, *args))
+    _move_index(indexes, obj.val, new_obj.val, keep_index)
+
+    # then rebuild each parent around its new child, a parent's keys are
+    # unchanged so its index carries over
+    for parent, i in reversed(parents):
+        new_items = _replace_at(parent.val.items, i, new_obj)
+        new_parent = _replace_items(parent, new_items)
+        _move_index(indexes, parent.val, new_parent.val, True)
+        new_obj = new_parent
+    return new_obj
 
 
 def _replace_val(obj, new_value):
@@ -202,32 +386,32 @@ def _replace_val(obj, new_value):
 
 
 def _set_cb(obj, i, val):
-    new_items = list(obj.val.items)
-    new_items[i] = _replace_val(new_items[i], val)
-    return new_items
+    items = obj.val.items
+    return _replace_at(items, i, _replace_val(items[i], val))
 
 
-def _set(obj, chain, val):
+def _set(indexes, obj, chain, val):
     if not chain:
+        indexes.clear()
         return _replace_val(obj, val)
     else:
-        return _modify_items(obj, chain, _set_cb, val)
+        _forget_indexes(indexes, _get(indexes, obj, chain).val)
+        return _modify_items(indexes, obj, chain, True, _set_cb, val)
 
 
 def _delete_cb(obj, i):
-    orig_item = obj.val.items[i]
-    new_items = list(obj.val.items)
-    del new_items[i]
+    items = obj.val.items
+    orig_item = items[i]
 
-    if obj.val.is_top_level_style and not new_items:
+    if obj.val.is_top_level_style and len(items) == 1:
         raise TypeError(
             'Deleting the last element of a top level map is not allowed as '
             'it would result in an invalid document when written out',
         )
     # If we're deleting the last item of an inline container, we need to
     # remove the comma from the new last item
-    elif not obj.val.is_multiline and len(obj.val.items) == i + 1:
-        new_items[-1] = new_items[-1]._replace(tail=())
+    elif not obj.val.is_multiline and i > 0 and len(items) == i + 1:
+        return items[:i - 1] + (items[i - 1]._replace(tail=()),)
     # If we're deleting an element of a non-inline container we may need to
     # adjust the item before (to change ', ' to ',\n')
     elif (
@@ -236,20 +420,25 @@ def _delete_cb(obj, i):
             orig_item.head == () and
             orig_item.tail[-1].src.endswith('\n')
     ):
-        new_items[i - 1] = new_items[i - 1]._replace(tail=orig_item.tail)
+        prev_item = items[i - 1]._replace(tail=orig_item.tail)
+        return items[:i - 1] + (prev_item,) + items[i + 1:]
     # If we're deleting an element of a non-inline container we may need to
     # adjust the item after (to change head to an indent)
     elif (
             obj.val.is_multiline and
-            i + 1 < len(obj.val.items) and
+            i + 1 < len(items) and
             orig_item.head != () and
             not orig_item.tail[-1].src.endswith('\n')
     ):
-        new_items[i] = new_items[i]._replace(head=orig_item.head)
-    return new_items
+        next_item = items[i + 1]._replace(head=orig_item.head)
+        return items[:i] + (next_item,) + items[i + 2:]
+    else:
+        return items[:i] + items[i + 1:]
 
 
-_delete = functools.partial(_modify_items, items_cb=_delete_cb)
+def _delete(indexes, obj, chain):
+    _forget_indexes(indexes, _get(indexes, obj, chain).val)
+    return _modify_items(indexes, obj, chain, False, _delete_cb)
 
 
 def _set_key_cb(obj, i, new_value):
@@ -266,28 +455,47 @@ def _set_key_cb(obj, i, new_value):
             )
         )
 
-    items = list(obj.val.items)
-    items[i] = items[i]._replace(key=key)
-    return items
+    items = obj.val.items
+    return _replace_at(items, i, items[i]._replace(key=key))
+
+
+def _set_key(indexes, obj, chain, new_value):
+    return _modify_items(indexes, obj, chain, False, _set_key_cb, new_value)
 
 
-def _set_key(obj, chain, new_value):
-    return _modify_items(obj, chain, _set_key_cb, new_value)
+# bounds the number of child proxies each proxy keeps for reuse
+_CHILD_PROXIES_SIZE = 64
 
 
 class AstProxyChain(object):
     def __init__(self, ast_proxy, chain):
         self._ast_proxy = ast_proxy
         self._chain = chain
+        self._children = {}
 
     def __setitem__(self, key, primitive):
-        self.root = _set(self.root, self.chain(key), primitive)
+        self.root = _set(self._indexes, self.root, self.chain(key), primitive)
 
     def __delitem__(self, key):
-        self.root = _delete(self.root, self.chain(key))
+        self.root = _delete(self._indexes, self.root, self.chain(key))
+        self._children.pop(key, None)
 
     def __getitem__(self, key):
-        return AstProxyChain(self._ast_proxy, self.chain(key))
+        # children only hold their chain so they can be reused across edits
+        try:
+            child = self._children[key]
+        except TypeError:  # unhashable, left for `_key_index` to reject
+            return AstProxyChain(self._ast_proxy, self.chain(key))
+        except KeyError:
+            child = AstProxyChain(self._ast_proxy, self.chain(key))
+            if len(self._children) < _CHILD_PROXIES_SIZE:
+                self._children[key] = child
+            return child
+        # `1`, `1.0` and `True` are equal keys but don't index the same way
+        if type(child._chain[-1]) is type(key):
+            return child
+        else:
+            return AstProxyChain(self._ast_proxy, self.chain(key))
 
     @property
     def root(self):
@@ -297,19 +505,25 @@ class AstProxyChain(object):
     def root(self, val):
         self._ast_proxy._ast_obj = val
 
+    @property
+    def _indexes(self):
+        return self._ast_proxy._map_indexes
+
     def chain(self, *args):
         return self._chain + args
 
     def replace_key(self, primitive):
         if not self.chain():
             raise TypeError('Index into a map to replace a key.')
-        self.root = _set_key(self.root, self.chain(), primitive)
+        self.root = _set_key(
+            self._indexes, self.root, self.chain(), primitive,
+        )
 
     def replace_value(self, primitive):
-        self.root = _set(self.root, self.chain(), primitive)
+        self.root = _set(self._indexes, self.root, self.chain(), primitive)
 
     def python_value(self):
-        return _python_value(_get(self.root, self.chain()).val)
+        return _python_value(_get(self._indexes, self.root, self.chain()).val)
 
 
 class AstProxy(AstProxyChain):
@@ -318,6 +532,7 @@ class AstProxy(AstProxyChain):
     def __init__(self, ast_obj):
         super(AstProxy, self).__init__(self, ())
         self._ast_obj = ast_obj
+        self._map_indexes = {}
 
 
 def loads_roundtrip(s):
@@ -346,13 +561,20 @@ def dumps(
         bare_keys=True,
         top_level_map=True,
         inline_small_containers=True,
+        trusted=False,
 ):
     settings = Settings(
         indent=0 if indented else -1,
         bare_keys=bare_keys,
         inline_small_containers=inline_small_containers,
     )
-    return unparse(_to_ast(v, settings, top_level_map=top_level_map))
+    if trusted:
+        # The tokens already spell out the source, skip checking them with
+        # the parser
+        tokens = _tokens(v, settings, top_level_map=top_level_map)
+        return ''.join(token.src for token in tokens)
+    else:
+        return unparse(_to_ast(v, settings, top_level_map=top_level_map))
 
 
 def load(stream):
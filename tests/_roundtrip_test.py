@@ -6,6 +6,7 @@ import io
 
 import pytest
 
+from dumbconf import _roundtrip
 from dumbconf._roundtrip import dump
 from dumbconf._roundtrip import dump_roundtrip
 from dumbconf._roundtrip import dumps
@@ -129,6 +130,19 @@ def test_replace_list_value_top_level():
     )
 
 
+def test_replace_list_value_negative_index():
+    val = loads_roundtrip('[true, false, true]')
+    val[-1] = None
+    ret = dumps_roundtrip(val)
+    assert ret == '[true, false, null]'
+
+
+def test_replace_list_value_negative_index_out_of_range():
+    val = loads_roundtrip('[true, false, true]')
+    with pytest.raises(IndexError):
+        val[-4] = None
+
+
 def test_replace_nested_map_value():
     val = loads_roundtrip(
         '{\n'
@@ -214,6 +228,13 @@ def test_delete_nested_fixup_trailing_comma_inline():
     assert ret == '{a: {b: {c: true}}}'
 
 
+def test_delete_only_item_inline():
+    val = loads_roundtrip('{a: {b: true}}')
+    del val['a']['b']
+    ret = dumps_roundtrip(val)
+    assert ret == '{a: {}}'
+
+
 def test_delete_fixup_trailing_space_multiline():
     val = loads_roundtrip(
         '[\n'
@@ -244,6 +265,54 @@ def test_delete_fixup_indent():
     )
 
 
+def test_child_proxies_reused():
+    val = loads_roundtrip('{a: {b: true, c: true}}')
+    assert val['a'] is val['a']
+    val['a']['b'] = False
+    del val['a']['c']
+    ret = dumps_roundtrip(val)
+    assert ret == '{a: {b: false}}'
+
+
+def test_child_proxy_dropped_on_delete():
+    val = loads_roundtrip('{a: 1, b: 2}')
+    child = val['a']
+    del val['a']
+    assert val['a'] is not child
+    assert val['b'] is val['b']
+
+
+def test_child_proxies_bounded():
+    n = _roundtrip._CHILD_PROXIES_SIZE
+    val = loads_roundtrip(dumps(list(range(n + 1))))
+    assert [val[i].python_value() for i in range(n + 1)] == list(range(n + 1))
+    assert val[n - 1] is val[n - 1]
+    assert val[n] is not val[n]
+
+
+@pytest.mark.parametrize('looked_up_first', (True, False))
+def test_child_proxy_equal_keys_of_other_types(looked_up_first):
+    val = loads_roundtrip('[1, 2, 3]')
+    if looked_up_first:
+        assert val[1].python_value() == 2
+    with pytest.raises(TypeError):
+        val[1.0].python_value()
+
+
+def test_child_proxy_unhashable_key():
+    val = loads_roundtrip('[1, 2]')
+    child = val[[0]]
+    with pytest.raises(TypeError):
+        child.python_value()
+
+
+def test_child_proxy_unhashable_map_key():
+    val = loads_roundtrip('{a: 1}')
+    child = val[['a']]
+    with pytest.raises(AssertionError):
+        child.python_value()
+
+
 def test_delete_last_top_level_map_key_error():
     val = loads_roundtrip('true: false')
     with pytest.raises(TypeError) as excinfo:
@@ -254,6 +323,50 @@ def test_delete_last_top_level_map_key_error():
     )
 
 
+def test_key_lookups_after_edits():
+    val = loads_roundtrip(
+        'a: {b: 1, c: [{d: 2}], e: 3}\n'
+        'f: 4\n'
+    )
+    # lookups populate the key indexes which the edits below must maintain
+    assert val['a']['c'][0]['d'].python_value() == 2
+    assert val['a']['e'].python_value() == 3
+
+    val['a']['b'] = 5
+    assert val['a']['b'].python_value() == 5
+    assert val['a']['e'].python_value() == 3
+
+    del val['a']['c']
+    assert val['a']['e'].python_value() == 3
+    assert val['f'].python_value() == 4
+
+    val['a']['e'].replace_key('g')
+    assert val['a']['g'].python_value() == 3
+
+    val['f'] = {'h': 6}
+    assert val['f']['h'].python_value() == 6
+    val['f'] = 7
+    assert dumps_roundtrip(val) == (
+        "a: {b: 5, 'g': 3}\n"
+        'f: 7\n'
+    )
+
+    val.replace_value({'i': 8})
+    assert val['i'].python_value() == 8
+
+
+def test_key_indexes_dropped_with_subtree():
+    val = loads_roundtrip(
+        'a: {b: {c: 1}}\n'
+        'd: 2\n'
+    )
+    assert val['a']['b']['c'].python_value() == 1
+    del val['a']
+    assert val['d'].python_value() == 2
+    # only the root map remains in the document
+    assert len(val._map_indexes) == 1
+
+
 def test_nested_python_value():
     val = loads_roundtrip(
         '{\n'
@@ -294,6 +407,13 @@ def test_loads_map():
     assert ret == {'a': 'a_value', 'b': 'b_value', 'c': 'c_value'}
 
 
+def test_loads_nested():
+    src = "{a: [1, {b: [], c: {}}, [[true]]], d: 'e'}"
+    ret = loads(src)
+    assert ret == {'a': [1, {'b': [], 'c': {}}, [[True]]], 'd': 'e'}
+    assert list(ret) == ['a', 'd']
+
+
 @pytest.mark.parametrize(
     ('v', 'expected'),
     (
@@ -316,6 +436,11 @@ def test_dumps_list():
     assert dumps([1, 2, 3], indented=False) == '[1, 2, 3]'
 
 
+def test_dumps_list_mixed_types():
+    ret = dumps([1, 'a', None, 2.5, True, [False]], indented=False)
+    assert ret == "[1, 'a', null, 2.5, true, [false]]"
+
+
 def test_dumps_list_indented():
     ret = dumps([1, 2, 3])
     assert ret == (
@@ -343,6 +468,15 @@ def test_dumps_nested_list_indented():
     )
 
 
+def test_dumps_deeply_nested_list():
+    val = [1]
+    for _ in range(64):
+        val = [val]
+    ret = dumps(val, inline_small_containers=False)
+    assert ret.splitlines()[65] == '    ' * 65 + '1,'
+    assert loads(ret) == val
+
+
 def test_dumps_map():
     assert dumps({1: 2, 3: 4}, indented=False) == '{1: 2, 3: 4}'
 
@@ -421,6 +555,21 @@ def test_non_bare_wordable_dump():
     assert ret == "{'true': {'un bearable': 'hi'}}"
 
 
+@pytest.mark.parametrize(
+    'v',
+    (
+        None,
+        [],
+        [1, 'a', [2.5, True]],
+        {'a': {'b': [1, 2]}, 'c d': {}},
+    ),
+)
+@pytest.mark.parametrize('indented', (True, False))
+def test_dumps_trusted(v, indented):
+    ret = dumps(v, indented=indented, trusted=True)
+    assert ret == dumps(v, indented=indented)
+
+
 def test_load():
     sio = io.StringIO('{hello: "world"}')
     assert load(sio) == {'hello': 'world'}
@@ -451,3 +600,19 @@ def test_dump_roundtrip():
     sio = io.StringIO()
     dump_roundtrip(loads_roundtrip(s), sio)
     assert sio.getvalue() == s
+
+
+def test_bare_key_cache_full(monkeypatch):
+    monkeypatch.setattr(_roundtrip, '_BARE_KEY_CACHE', {})
+    monkeypatch.setattr(_roundtrip, '_BARE_KEY_CACHE_SIZE', 1)
+    ret = dumps({'a': 1, 'not bare': 2}, indented=False)
+    assert ret == "{a: 1, 'not bare': 2}"
+    assert _roundtrip._BARE_KEY_CACHE == {'a': True}
+
+
+def test_dumps_subclasses():
+    ret = dumps(collections.OrderedDict((('a', [1]), ('b', 2))))
+    assert ret == (
+        'a: [1]\n'
+        'b: 2\n'
+    )